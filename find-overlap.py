@@ -8,9 +8,9 @@
 Command line tool which reads a file system (or any other data) and
 finds the overlapping range after an interrupted GParted resize/move.
 
-Works by computing the MD5 hash of every block and finding blocks with
-a duplicate copy to identify the overlap size and location.  Takes as
-long to run as reading the named device.
+Works by computing a hash of every block (see --hash) and finding
+blocks with a duplicate copy to identify the overlap size and location.
+Takes as long to run as reading the named device.
 
 Command line usage:
     find-overlap.py [DEVICE]
@@ -18,72 +18,305 @@ Command line usage:
 
 
 import argparse
+import array
+import errno
 import hashlib
+import io
+import mmap
+import multiprocessing
+import os
+import stat
 import sys
+import threading
 
-from collections import namedtuple
+from collections import Counter, defaultdict, deque, namedtuple
+from itertools import combinations
+from multiprocessing.pool import ThreadPool
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# Optional non-cryptographic or faster hashes, used when installed.
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+try:
+    import blake3
+except ImportError:
+    blake3 = None
 
 
 PROGNAME = 'find-overlap.py'
 BLOCKSIZE = 1024*1024
+BATCH_BLOCKS = 8
+PREFETCH_BATCHES = 4
+HASH_THREADS = multiprocessing.cpu_count()
+DUMP_READ_SIZE = 1024*1024
+ZERO_BLOCK = b'\x00' * BLOCKSIZE
+ZERO_PREFIX_SIZE = 64
+DIGEST_SIZE = 16
+HASH_ALGORITHMS = ((['xxh128'] if xxhash else []) +
+                   (['blake3'] if blake3 else []) +
+                   [name for name in ['sha1', 'md5', 'sha256', 'blake2b']
+                    if name in hashlib.algorithms_available])
+# Fastest available hash first: xxh128 and BLAKE3 when installed,
+# otherwise SHA-1, which is faster than MD5 on CPUs with SHA extensions.
+DEFAULT_HASH_ALGORITHM = HASH_ALGORITHMS[0]
+
+
+# Reading directly into page aligned memory maps and hashing memory
+# mapped files without copying requires memoryview support for mmap
+# objects, which Python 2 lacks.
+try:
+    memoryview(mmap.mmap(-1, mmap.PAGESIZE))
+    MMAP_MEMORYVIEW = True
+except TypeError:
+    MMAP_MEMORYVIEW = False
 
 
 dump_hashes_fname = None
+hash_algorithm = DEFAULT_HASH_ALGORITHM
+zero_block_hashes = {}
+
+
+def is_zero_block(data):
+    """Return true if the memoryview of a block of data is a whole block
+    of zeros.
+
+    The first ZERO_PREFIX_SIZE bytes are checked first so that most non
+    zero blocks are rejected without comparing the whole block.
+    """
+    if len(data) != BLOCKSIZE:
+        return False
+    if data[:ZERO_PREFIX_SIZE].tobytes() != ZERO_BLOCK[:ZERO_PREFIX_SIZE]:
+        return False
+    return data.tobytes() == ZERO_BLOCK
+
+
+def hash_block(data):
+    """Return the hash of one block of data, passed as a memoryview,
+    using the selected hash algorithm.
+
+    Digests are truncated to DIGEST_SIZE (16) bytes, the size of an MD5
+    hash, so the algorithm doesn't change the memory used to hold them.
+    Empty and sparse file systems contain long runs of zero blocks so
+    the hash of a zero block is only computed once per algorithm.
+    Comparing a block with zeros is many times faster than hashing it.
+    """
+    if is_zero_block(data):
+        if hash_algorithm not in zero_block_hashes:
+            zero_block_hashes[hash_algorithm] = \
+                compute_hash(hash_algorithm, ZERO_BLOCK)
+        return zero_block_hashes[hash_algorithm]
+    return compute_hash(hash_algorithm, data)
+
+
+def compute_hash(algorithm, data):
+    """Return the DIGEST_SIZE byte digest of data using the named hash
+    algorithm
+    """
+    if algorithm == 'xxh128':
+        return xxhash.xxh128(data).digest()
+    if algorithm == 'blake3':
+        return blake3.blake3(data).digest(length=DIGEST_SIZE)
+    return hashlib.new(algorithm, data).digest()[:DIGEST_SIZE]
+
 
+def split_blocks(data):
+    """Return list of memoryview slices of each block in the batch of
+    data.
 
-def read_hashes(f):
-    """Return list of MD5 hashes for all blocks read from the open file
-    object.
+    Slicing a memoryview avoids copying the data again for each block.
+    The last block may be short.
     """
-    md5_hashes = []
+    view = memoryview(data)
+    return [view[offset:offset+BLOCKSIZE]
+            for offset in range(0, len(data), BLOCKSIZE)]
+
+
+def open_device(fname):
+    """Return a file object for reading the named device or file.
+
+    Devices are opened with O_DIRECT, when supported, so reading the
+    whole device doesn't evict everything else from the page cache.
+    Falls back to normal reads when O_DIRECT is rejected with EINVAL, as
+    it is by some devices.  Regular files are opened normally as they
+    are memory mapped instead, see map_file().  Files opened for normal
+    reads are advised they will be read sequentially.
+    """
+    flags = os.O_RDONLY
+    if MMAP_MEMORYVIEW and not stat.S_ISREG(os.stat(fname).st_mode):
+        flags |= getattr(os, 'O_DIRECT', 0)
+    try:
+        fd = os.open(fname, flags)
+    except OSError as e:
+        if e.errno != errno.EINVAL or flags == os.O_RDONLY:
+            raise
+        fd = os.open(fname, os.O_RDONLY)
+        flags = os.O_RDONLY
+    if flags == os.O_RDONLY and hasattr(os, 'posix_fadvise'):
+        # Reads go through the page cache so ask for aggressive read
+        # ahead of the sequential scan.
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+    return io.FileIO(fd, mode='r')
+
+
+def read_batch(f):
+    """Return the next batch of up to BATCH_BLOCKS blocks read from the
+    open file object.  Empty at the end of the file.
+
+    When possible the data is read into a new anonymous memory map,
+    which is page aligned as O_DIRECT reads require, and returned as a
+    memoryview so it isn't copied.
+    """
+    if not MMAP_MEMORYVIEW or not hasattr(f, 'readinto'):
+        return f.read(BATCH_BLOCKS * BLOCKSIZE)
+    view = memoryview(mmap.mmap(-1, BATCH_BLOCKS * BLOCKSIZE))
+    size = 0
+    while size < len(view):
+        count = f.readinto(view[size:])
+        if not count:
+            break
+        size += count
+    return view[:size]
+
+
+def read_batches(f):
+    """Generator yielding batches of BATCH_BLOCKS blocks read from the
+    open file object.
+
+    Reading is done by a background thread which reads ahead up to
+    PREFETCH_BATCHES batches so that reading the next batch from the
+    device overlaps with hashing the current batch.  Any exception
+    raised while reading is re-raised in the calling thread.
+    """
+    batches = queue.Queue(maxsize=PREFETCH_BATCHES)
+
+    def reader():
+        try:
+            while True:
+                data = read_batch(f)
+                batches.put(data)
+                if not data:
+                    break
+        except Exception as e:
+            batches.put(e)
+
+    thread = threading.Thread(target=reader)
+    thread.daemon = True
+    thread.start()
     while True:
-        data = f.read(BLOCKSIZE)
+        data = batches.get()
+        if isinstance(data, Exception):
+            raise data
         if not data:
             break
-        md5_hash = hashlib.md5(data).digest()
-        md5_hashes.append(md5_hash)
-    return md5_hashes
+        yield data
+    thread.join()
 
 
-def generate_matching_hashes(md5_hashes):
-    """Return a dictionary with MD5 hash as the key to the list of
-    blocks numbers with with the same hash from the list of MD5 hashes.
+def map_file(f):
+    """Return a read only memory map of the open file object, or None
+    when it isn't a non-empty regular file read from the start.
 
-    Example:
+    Hashing blocks directly from a memory map avoids allocating and
+    copying every block and lets kernel read ahead fetch later blocks
+    while earlier ones are being hashed.
+    """
+    if not MMAP_MEMORYVIEW:
+        return None
+    try:
+        fd = f.fileno()
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode) or st.st_size == 0 or f.tell() != 0:
+            return None
+        mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    except (AttributeError, ValueError, EnvironmentError):
+        return None
+    if hasattr(mm, 'madvise'):
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    return mm
+
+
+def map_batches(mm):
+    """Generator yielding batches of BATCH_BLOCKS blocks as memoryview
+    slices of the memory map
+    """
+    view = memoryview(mm)
+    batch_size = BATCH_BLOCKS * BLOCKSIZE
+    for offset in range(0, len(view), batch_size):
+        yield view[offset:offset+batch_size]
 
-        >>> generate_matching_hashes(['#0', '#0', '#2'])
-        {'#0': [0, 1], '#2': [2]}
 
-    Read the returned dictionary as key '#0' is the hash for data blocks
-    0 and 1, and key '#2' is the hash for block 2.
+def iter_hashes(f):
+    """Generator yielding the hash of each block read from the open file
+    object in order.
+
+    Blocks are hashed in parallel by a pool of HASH_THREADS threads, as
+    hashlib releases the GIL while hashing large buffers.  Up to
+    PREFETCH_BATCHES batches are hashed concurrently and their results
+    are yielded in order.  Regular files are hashed from a memory map,
+    other files are read.
     """
-    matching_hashes = {}
-    blknum = 0
-    for md5_hash in md5_hashes:
-        if md5_hash in matching_hashes:
-            matching_hashes[md5_hash].append(blknum)
-        else:
-            matching_hashes[md5_hash] = [blknum]
-        blknum += 1
-    return matching_hashes
+    mm = map_file(f)
+    batches = map_batches(mm) if mm is not None else read_batches(f)
+    pool = ThreadPool(HASH_THREADS)
+    try:
+        pending = deque()
+        for data in batches:
+            pending.append(pool.map_async(hash_block, split_blocks(data)))
+            if len(pending) > PREFETCH_BATCHES:
+                for md5_hash in pending.popleft().get():
+                    yield md5_hash
+        while pending:
+            for md5_hash in pending.popleft().get():
+                yield md5_hash
+    finally:
+        pool.terminate()
+
+
+def compact_hashes(md5_hashes):
+    """Return an array of hash ids, one per block, from the list (or
+    other iterable) of hashes.
+
+    Each hash is replaced by the first block number with that hash, the
+    same substitution used in the hashes dump file.  A contiguous array
+    of integers uses a fraction of the memory of a list of 16 byte
+    digests and turns comparing the hashes of two blocks into an integer
+    comparison.
 
+    Example:
 
-def eliminate_non_duplicates(matching_hashes):
-    """Mutate the passed matching hashes dictionary deleting items
-    (MD5 hash keys and block number lists) of unique blocks and blocks
-    with more than 4 copies, as neither contribute to finding the
-    overlapping range.
+        >>> compact_hashes(['H0', 'H1', 'H0', 'H3'])
+        array('i', [0, 1, 0, 3])
+    """
+    first_blocks = {}
+    return array.array('i', [first_blocks.setdefault(md5_hash, blknum)
+                             for blknum, md5_hash in enumerate(md5_hashes)])
+
+
+def generate_matching_hashes(md5_hashes):
+    """Return a dictionary with hash as the key to the list of blocks
+    numbers with with the same hash from the list of hashes.
+    Only hashes of blocks with 2 to 4 copies are included.  Unique
+    blocks and blocks with more than 4 copies are left out as neither
+    contribute to finding the overlapping range.
 
     Example:
-        >>> matching_hashes = {'#0': [0],
-                               '#1': [1, 2],
-                               '#2': [3],
-                               '#3': [4, 5, 6],
-                               '#4': [7, 8, 9, 10],
-                               '#5': [11, 12, 13, 14, 15]}
-        >>> eliminate_non_duplicates(matching_hashes)
-        >>> matching_hashes
-        {'#1': [1, 2], '#3': [4, 5, 6], '#4': [7, 8, 9, 10]}
+
+        >>> generate_matching_hashes(['#0', '#0', '#2', '#3', '#3', '#3',
+                                      '#3', '#3'])
+        {'#0': [0, 1]}
+
+    Read the returned dictionary as key '#0' is the hash for data blocks
+    0 and 1.  Block 2 is unique and blocks 3 to 7 have more than 4
+    copies.
     """
     # Real case test-hashes-f18089.txt.xz had:
     #     Blocks:         748453   (1 MiB each)
@@ -108,14 +341,22 @@ def eliminate_non_duplicates(matching_hashes):
     # Therefore keep matching blocks up to a count of 4 replicas to
     # allow for file systems containing multiple copies of files covered
     # by the overlapping range.
-    for key, value in list(matching_hashes.items()):
-        if len(value) < 2 or len(value) > 4:
-            del matching_hashes[key]
+    #
+    # Unique blocks are the large majority so count the copies of each
+    # hash first and only build block lists for hashes being kept.
+    hash_counts = Counter(md5_hashes)
+    matching_hashes = {md5_hash: [] for md5_hash, count in hash_counts.items()
+                       if 2 <= count <= 4}
+    for blknum, md5_hash in enumerate(md5_hashes):
+        blknums = matching_hashes.get(md5_hash)
+        if blknums is not None:
+            blknums.append(blknum)
+    return matching_hashes
 
 
 def compute_offset_blocks(matching_hashes):
     """Return a new dictionary keyed by the offset between two blocks
-    with the same MD5 hash which looks up the list of the first of each
+    with the same hash which looks up the list of the first of each
     pair of matched blocks.  The second matching block is simply the
     first block number plus the offset used as the dictionary key.
 
@@ -129,43 +370,68 @@ def compute_offset_blocks(matching_hashes):
         {1: [20, 21, 25, 26, 27], 2: [20, 25, 26], 3: [10, 11, 12, 25], 7: [1]}
 
     Read the returned dictionary as saying blocks [20, 21, 25, 26, 27]
-    have a partner with the same MD5 hash at offset 1, namely blocks
+    have a partner with the same hash at offset 1, namely blocks
     [21, 22, 26, 27, 28] respectively, etc and finally block [1] has a
-    partner with the same MD5 hash at offset 7.
+    partner with the same hash at offset 7.  The lists of blocks
+    are returned as array('i') arrays.
     """
-    offset_blocks = {}
+    # Every pair in a group is used, not just neighbouring blocks.  When
+    # two copies of a file are both covered by the overlapping range the
+    # group is [a, b, a+offset, b+offset] and the overlap offset is only
+    # found between non-neighbouring blocks.
+    #
+    # Nearly all groups are pairs (19756 of 19762 in the real case
+    # test-hashes-f18089.txt.xz) so handle them directly, without
+    # creating a combinations iterator for each one.
+    offset_blocks = defaultdict(list)
     for blknums in matching_hashes.values():
-        blknums_copy = list(blknums)
-        while len(blknums_copy) >= 2:
-            fst_dup_blknum = blknums_copy[0]
-            blknums_copy.pop(0)
-            for snd_dup_blknum in blknums_copy:
-                offset = snd_dup_blknum - fst_dup_blknum
-                if offset in offset_blocks:
-                    offset_blocks[offset].append(fst_dup_blknum)
-                else:
-                    offset_blocks[offset] = [fst_dup_blknum]
+        if len(blknums) == 2:
+            fst_dup_blknum, snd_dup_blknum = blknums
+            offset_blocks[snd_dup_blknum - fst_dup_blknum].append(
+                fst_dup_blknum)
+            continue
+        for fst_dup_blknum, snd_dup_blknum in combinations(blknums, 2):
+            offset = snd_dup_blknum - fst_dup_blknum
+            offset_blocks[offset].append(fst_dup_blknum)
     # Above iteration of matching_hashes dict values is probably in the
-    # key (MD5 hash) order and definitely not in increasing block number
+    # key (hash) order and definitely not in increasing block number
     # order.  Sort the lists of duplicate block numbers (first block
-    # number of a duplicate pair).
-    for key in offset_blocks.keys():
-        offset_blocks[key].sort()
-    return offset_blocks
+    # number of a duplicate pair), storing each as a compact array of
+    # 32-bit integers rather than a list of Python integer objects.
+    return {offset: array.array('i', sorted(blknums))
+            for offset, blknums in offset_blocks.items()}
 
 
 def find_start_matching_block(start, offset, md5_hashes):
     """Return starting block which still matches at offset
 
-    From the start block, which is assumed to match the MD5 hash of
+    From the start block, which is assumed to match the hash of
     block at start + offset, search backwards for the earliest block
     which still matches at block + offset.
+
+    Compares slices of hashes, so the comparison loop runs in C.  Gallops
+    backwards doubling the size of the slice compared until a mismatch
+    is found, then binary searches that slice for the last mismatch.
     """
+    count = 1
     while start > 0:
-        test = start - 1
-        if md5_hashes[test] != md5_hashes[test+offset]:
+        count = min(count, start)
+        test = start - count
+        if md5_hashes[test:start] != md5_hashes[test+offset:start+offset]:
             break
         start = test
+        count *= 2
+    if start <= 0:
+        return start
+    # Last mismatch is within [start-count:start)
+    while count > 1:
+        half = count // 2
+        test = start - half
+        if md5_hashes[test:start] == md5_hashes[test+offset:start+offset]:
+            start = test
+            count -= half
+        else:
+            count = half
     return start
 
 
@@ -176,14 +442,61 @@ def find_stop_matching_block(stop, offset, md5_hashes):
     no longer matches at block + offset.  find_start_matching_block()
     and find_stop_matching_block() are a pair which find the Python
     slicing range [start:stop] of an overlapping range of blocks.
+    Searches forwards in the same way as find_start_matching_block()
+    searches backwards.
     """
-    while stop + offset < len(md5_hashes):
-        if md5_hashes[stop] != md5_hashes[stop+offset]:
+    end = len(md5_hashes) - offset
+    count = 1
+    while stop < end:
+        count = min(count, end - stop)
+        test = stop + count
+        if md5_hashes[stop:test] != md5_hashes[stop+offset:test+offset]:
             break
-        stop += 1
+        stop = test
+        count *= 2
+    if stop >= end:
+        return stop
+    # First mismatch is within [stop:stop+count)
+    while count > 1:
+        half = count // 2
+        test = stop + half
+        if md5_hashes[stop:test] == md5_hashes[stop+offset:test+offset]:
+            stop = test
+            count -= half
+        else:
+            count = half
     return stop
 
 
+def find_consecutive_run(blocks, index):
+    """Return the slicing range [start:stop) of block numbers of the run
+    of consecutive blocks in the sorted list of blocks which includes
+    blocks[index].
+
+    Block numbers in the list are unique and sorted, so blocks[i] - i
+    stays the same within a run of consecutive blocks and never
+    decreases.  This allows both ends of the run to be found by binary
+    search instead of stepping through the list.
+    """
+    key = blocks[index] - index
+    lo, hi = 0, index
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if blocks[mid] - mid < key:
+            lo = mid + 1
+        else:
+            hi = mid
+    start = blocks[lo]
+    lo, hi = index + 1, len(blocks)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if blocks[mid] - mid > key:
+            hi = mid
+        else:
+            lo = mid + 1
+    stop = blocks[lo-1] + 1
+    return start, stop
+
 
 def compute_candidate_ranges(offset_blocks, md5_hashes):
     """Return list of candidate overlapping ranges
@@ -200,17 +513,21 @@ def compute_candidate_ranges(offset_blocks, md5_hashes):
     matching range divided by the size of the offset.  (A rank of 1.0
     indicates the matching range exactly equals the offset and a valid
     overlapping data range has been found).
+
+    Every block in the list for an offset is already known to match its
+    partner block at that offset, so searching for the start and stop of
+    the matching range begins from the ends of the run of consecutive
+    blocks containing the median block.
     """
     candidate_ranges = []
     Candidate = namedtuple('Candidate',
                           ['offset', 'start_block', 'stop_block',
                            'total_blocks', 'rank'])
     for offset, blocks in offset_blocks.items():
-        median_index = int(round((len(blocks)) / 2))
-        start_block = find_start_matching_block(blocks[median_index],
-                                                offset, md5_hashes)
-        stop_block = find_stop_matching_block(blocks[median_index],
-                                              offset, md5_hashes)
+        median_index = len(blocks) // 2
+        run_start, run_stop = find_consecutive_run(blocks, median_index)
+        start_block = find_start_matching_block(run_start, offset, md5_hashes)
+        stop_block = find_stop_matching_block(run_stop, offset, md5_hashes)
         matching_size = stop_block - start_block
         rank = float(matching_size) / float(offset)
         candidate_ranges.append(Candidate(offset, start_block, stop_block,
@@ -232,20 +549,21 @@ def candidate_is_full_range(candidate_range):
 
 def candidate_range_is_large_enough(candidate_range):
     """Exclude offsets of 2 or less because accepting groups of up to 4
-    block allows 4 blocks in a row with the same MD5 hash to be found as
+    block allows 4 blocks in a row with the same hash to be found as
     an overlapping data range of 2 blocks.
     """
     matching_size = candidate_range.stop_block - candidate_range.start_block
     return matching_size > 2
 
 
-def dump_hashes(fname, md5_hashes, matching_hashes):
+def dump_hashes(fname, hash_ids):
     """Write substitute hashes to the named hashes dump file
 
-    The 128-bit (8 byte) binary MD5 hashes are substituted by '#%d'
-    where '%d' is the first block number with that hash.  Each
-    substitute hash is written on a separate line.  Start of an example
-    hash dump file:
+    The 128-bit (16 byte) binary hashes are substituted by '#%d'
+    where '%d' is the first block number with that hash, which is the
+    hash id from compact_hashes().  Each substitute hash is written on a
+    separate line, all in a single write.  Start of an example hash dump
+    file:
         #0
         #1
         #2
@@ -254,21 +572,22 @@ def dump_hashes(fname, md5_hashes, matching_hashes):
         f = open(fname, mode='w')
     except IOError as e:
         sys.exit(PROGNAME + ': ' + str(e))
-    for md5_hash in md5_hashes:
-        f.write('#%d\n' % (matching_hashes[md5_hash][0]))
+    f.write(''.join(['#%d\n' % (hash_id) for hash_id in hash_ids]))
     f.close()
     
 
 def find_overlap_from_hashes(md5_hashes):
-    """Return list of validated overlapping ranges from list of MD5
-    hashes
-    """
-    matching_hashes = generate_matching_hashes(md5_hashes)
+    """Return list of validated overlapping ranges from list of hashes"""
+    return find_overlap_from_hash_ids(compact_hashes(md5_hashes))
+
+
+def find_overlap_from_hash_ids(hash_ids):
+    """Return list of validated overlapping ranges from array of hash ids"""
     if dump_hashes_fname:
-        dump_hashes(dump_hashes_fname, md5_hashes, matching_hashes)
-    eliminate_non_duplicates(matching_hashes)
+        dump_hashes(dump_hashes_fname, hash_ids)
+    matching_hashes = generate_matching_hashes(hash_ids)
     offset_blocks = compute_offset_blocks(matching_hashes)
-    candidate_ranges = compute_candidate_ranges(offset_blocks, md5_hashes)
+    candidate_ranges = compute_candidate_ranges(offset_blocks, hash_ids)
     candidate_ranges = list(filter(candidate_is_full_range, candidate_ranges))
     candidate_ranges = list(filter(candidate_range_is_large_enough,
                                    candidate_ranges))
@@ -304,19 +623,48 @@ def print_overlap_output(candidate_ranges):
         print_overlap(cr)
 
 
+def read_dump_hash_ids(f):
+    """Return array of hash ids read from the open hashes dump file
+
+    The '#%d' substitute hashes written by dump_hashes() are already hash
+    ids so they are converted to integers in bulk, without the per line
+    work of compacting them.  The file is parsed in chunks of about
+    DUMP_READ_SIZE characters so the text of the whole file is never
+    held in memory at once.  Any other file is re-read from the start as
+    one opaque hash per line.
+    """
+    hash_ids = array.array('i')
+    while True:
+        data = f.read(DUMP_READ_SIZE)
+        if not data:
+            break
+        # Complete the last line of the chunk
+        data += f.readline()
+        try:
+            hash_ids.extend(map(int, data.replace('#', ' ').split()))
+        except (ValueError, OverflowError):
+            f.seek(0)
+            return compact_hashes(f.read().splitlines())
+    return hash_ids
+
+
 def find_overlap_from_open_hashes_file(f):
     """Read hashes from previous dump file, search for the overlapping
     range and print the results
     """
-    md5_hashes = f.read().splitlines()
-    candidate_ranges = find_overlap_from_hashes(md5_hashes)
+    hash_ids = read_dump_hash_ids(f)
+    candidate_ranges = find_overlap_from_hash_ids(hash_ids)
     print_overlap_output(candidate_ranges)
 
 
 def find_overlap_from_open_file(f):
-    """Search for the overlapping range and print the findings"""
-    md5_hashes = read_hashes(f)
-    candidate_ranges = find_overlap_from_hashes(md5_hashes)
+    """Search for the overlapping range and print the findings
+
+    Hashes are compacted into hash ids as the blocks are hashed so the
+    list of all the digests is never held in memory.
+    """
+    hash_ids = compact_hashes(iter_hashes(f))
+    candidate_ranges = find_overlap_from_hash_ids(hash_ids)
     print_overlap_output(candidate_ranges)
 
 
@@ -325,6 +673,7 @@ def main(args=None):
     the overlapping range in the named device or stdin
     """
     global dump_hashes_fname
+    global hash_algorithm
     parser = argparse.ArgumentParser(description="""
         Find overlapping portion of a file system after an interrupted
         GParted resize/move.""")
@@ -334,10 +683,17 @@ def main(args=None):
         from stdin or named device""")
     parser.add_argument('--dump-hashes', dest='dump_hashes_fname',
                         metavar='DUMP_FILE', help='Write hashes to this file')
+    parser.add_argument('--hash', dest='hash_algorithm',
+                        default=DEFAULT_HASH_ALGORITHM,
+                        choices=HASH_ALGORITHMS, help="""
+        Hash algorithm used to compare blocks (default: %s).  xxh128 and
+        blake3 are available when the xxhash and blake3 modules are
+        installed""" % DEFAULT_HASH_ALGORITHM)
     parser.add_argument('device', nargs='?', help="""
         optional device or file to read""")
     args = parser.parse_args(args)
     dump_hashes_fname = args.dump_hashes_fname
+    hash_algorithm = args.hash_algorithm
     if args.read_hashes_fname:
         try:
             f = open(args.read_hashes_fname, mode='r')
@@ -347,8 +703,8 @@ def main(args=None):
         f.close()
     elif args.device:
         try:
-            f = open(args.device, mode='rb')
-        except IOError as e:
+            f = open_device(args.device)
+        except (IOError, OSError) as e:
             return PROGNAME + ': ' + str(e)
         find_overlap_from_open_file(f)
         f.close()
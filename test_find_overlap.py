@@ -15,6 +15,7 @@ like this:
 """
 
 
+import hashlib
 import importlib
 import io
 import os
@@ -96,35 +97,123 @@ def test_command_line_dump_file():
     os.remove(hashes_fname)
 
 
+def test_is_zero_block():
+    blocksize = find_overlap.BLOCKSIZE
+    assert find_overlap.is_zero_block(memoryview(b'\x00' * blocksize))
+    assert not find_overlap.is_zero_block(memoryview(b'\x00' * 512))
+    data = b'\x00' * (blocksize - 1) + b'\x01'
+    assert not find_overlap.is_zero_block(memoryview(data))
+
+
+def test_split_blocks():
+    """Test batch is split into whole blocks and a short final block"""
+    data = b'\x00' * find_overlap.BLOCKSIZE + b'\x01' * 10
+    result = find_overlap.split_blocks(data)
+    result = [b.tobytes() for b in result]
+    assert result == [b'\x00' * find_overlap.BLOCKSIZE, b'\x01' * 10]
+
+
 RESULT_MD5_HASHES = [b"\xb6\xd8\x1b6\nVr\xd8\x0c'C\x0f9\x15>,",
                      b"\xb6\xd8\x1b6\nVr\xd8\x0c'C\x0f9\x15>,",
                      b'Y\x07\x15\x90\t\x9d!\xddC\x98\x96Y#8\xbf\x95']
-def test_read_hashes():
+def test_iter_hashes(monkeypatch):
     """Test reading 2.5 MiB of binary zero produces the expected list of
     MD5 hashes
     """
+    monkeypatch.setattr(find_overlap, 'hash_algorithm', 'md5')
     f = io.BytesIO(int(find_overlap.BLOCKSIZE * 2.5) * b'\x00')
-    result = find_overlap.read_hashes(f)
+    result = list(find_overlap.iter_hashes(f))
+    assert result == RESULT_MD5_HASHES
+
+
+def test_open_device_iter_hashes(monkeypatch):
+    """Test reading hashes from a regular file opened by open_device(),
+    which is memory mapped where supported
+    """
+    monkeypatch.setattr(find_overlap, 'hash_algorithm', 'md5')
+    image_fname = 'image.img'
+    with open(image_fname, 'wb') as f:
+        f.write(int(find_overlap.BLOCKSIZE * 2.5) * b'\x00')
+    f = find_overlap.open_device(image_fname)
+    result = list(find_overlap.iter_hashes(f))
+    f.close()
     assert result == RESULT_MD5_HASHES
+    os.remove(image_fname)
+
+
+def test_map_file():
+    """Test only non-empty regular files are memory mapped"""
+    image_fname = 'image.img'
+    with open(image_fname, 'wb') as f:
+        f.write(b'\x00' * 4096)
+    with open(image_fname, 'rb') as f:
+        mm = find_overlap.map_file(f)
+        if find_overlap.MMAP_MEMORYVIEW:
+            assert len(mm) == 4096
+        else:
+            assert mm is None
+    os.remove(image_fname)
+    with open('/dev/null', 'rb') as f:
+        assert find_overlap.map_file(f) is None
+    assert find_overlap.map_file(io.BytesIO(b'\x00' * 4096)) is None
+
+
+def test_open_device_without_o_direct():
+    """Test /dev/null, which rejects O_DIRECT, is still opened"""
+    f = find_overlap.open_device('/dev/null')
+    assert list(find_overlap.iter_hashes(f)) == []
+    f.close()
+
+
+def test_iter_hashes_multiple_batches(monkeypatch):
+    """Test reading more than one batch of blocks hashes every block in
+    order, including the short final block
+    """
+    monkeypatch.setattr(find_overlap, 'hash_algorithm', 'md5')
+    blocks = [bytes(bytearray([i])) * find_overlap.BLOCKSIZE
+              for i in range(find_overlap.BATCH_BLOCKS + 1)]
+    blocks.append(b'\xff' * 512)
+    f = io.BytesIO(b''.join(blocks))
+    result = list(find_overlap.iter_hashes(f))
+    assert result == [hashlib.md5(b).digest() for b in blocks]
+
+
+def test_iter_hashes_read_error():
+    """Test an error reading the file is raised to the caller"""
+    class FailingFile(object):
+        def read(self, size):
+            raise IOError('Input/output error')
+    with pytest.raises(IOError):
+        list(find_overlap.iter_hashes(FailingFile()))
+
+
+def test_iter_hashes_sha256(monkeypatch):
+    """Test selecting another hash algorithm produces its digests
+    truncated to 16 bytes
+    """
+    monkeypatch.setattr(find_overlap, 'hash_algorithm', 'sha256')
+    data = find_overlap.BLOCKSIZE * b'\x00'
+    result = list(find_overlap.iter_hashes(io.BytesIO(data)))
+    assert result == [hashlib.sha256(data).digest()[:16]]
+
+
+def test_compact_hashes():
+    md5_hashes = ['H0', 'H1', 'H0', 'H3', 'H1']
+    result = find_overlap.compact_hashes(md5_hashes)
+    assert list(result) == [0, 1, 0, 3, 1]
 
 
 def test_generate_matching_hashes():
-    """Test using result from test_read_hashes()"""
+    """Test using result from test_iter_hashes()"""
     result = find_overlap.generate_matching_hashes(RESULT_MD5_HASHES)
-    assert result == {b"\xb6\xd8\x1b6\nVr\xd8\x0c'C\x0f9\x15>,": [0, 1],
-                      b'Y\x07\x15\x90\t\x9d!\xddC\x98\x96Y#8\xbf\x95': [2]}
+    assert result == {b"\xb6\xd8\x1b6\nVr\xd8\x0c'C\x0f9\x15>,": [0, 1]}
 
 
-def test_eliminate_non_duplicates():
-    test_dict = {'#0': [0],
-                 '#1': [1, 2],
-                 '#2': [3],
-                 '#3': [4, 5, 6],
-                 '#4': [7, 8, 9, 10],
-                 '#5': [11, 12, 13, 14, 15]}
-    result_dict = {'#1': [1, 2], '#3': [4, 5, 6], '#4': [7, 8, 9, 10]}
-    find_overlap.eliminate_non_duplicates(test_dict)
-    assert test_dict == result_dict
+def test_generate_matching_hashes_eliminates_non_duplicates():
+    test_hashes = ['#0', '#1', '#1', '#2', '#3', '#3', '#3',
+                   '#4', '#4', '#4', '#4', '#5', '#5', '#5', '#5', '#5']
+    result = find_overlap.generate_matching_hashes(test_hashes)
+    assert result == {'#1': [1, 2], '#3': [4, 5, 6], '#4': [7, 8, 9, 10]}
 
 
 def test_compute_offset_blocks():
@@ -135,9 +224,18 @@ def test_compute_offset_blocks():
                  '#4': [20, 21, 22],
                  '#5': [25, 26, 27, 28]}
     result = find_overlap.compute_offset_blocks(test_dict)
+    result = {offset: list(blocks) for offset, blocks in result.items()}
     assert result == {1: [20, 21, 25, 26, 27], 2: [20, 25, 26], 3: [10, 11, 12, 25], 7: [1]}
 
 
+def test_compute_offset_blocks_non_neighbouring_pairs():
+    """Test two copies of a block both within the overlapping range
+    produce the overlap offset from non-neighbouring pairs
+    """
+    result = find_overlap.compute_offset_blocks({'#2': [2, 5, 12, 15]})
+    assert list(result[10]) == [2, 5]
+
+
 def test_find_start_matching_block():
     test_hashes = ['#0', '#0', '#0', '#0']
     assert find_overlap.find_start_matching_block(2, 1, test_hashes) == 0
@@ -152,6 +250,33 @@ def test_find_stop_matching_block():
     assert find_overlap.find_stop_matching_block(1, 2, test_hashes) == 3
 
 
+def test_find_matching_blocks_long_range():
+    """Test a long matching range, needing several doubled slices of
+    hashes to be compared, is found exactly
+    """
+    for size in [1, 2, 3, 63, 64, 65, 200]:
+        test_hashes = ['#a'] + list(range(size)) + list(range(size)) + ['#b']
+        assert find_overlap.find_start_matching_block(size, size,
+                                                      test_hashes) == 1
+        assert find_overlap.find_stop_matching_block(1, size,
+                                                     test_hashes) == size + 1
+
+
+def test_find_matching_blocks_whole_list():
+    """Test a matching range reaching both ends of the list of hashes"""
+    test_hashes = list(range(100)) + list(range(100))
+    assert find_overlap.find_start_matching_block(50, 100, test_hashes) == 0
+    assert find_overlap.find_stop_matching_block(50, 100, test_hashes) == 100
+
+
+def test_find_consecutive_run():
+    blocks = [1, 3, 4, 5, 6, 9, 10]
+    assert find_overlap.find_consecutive_run(blocks, 0) == (1, 2)
+    assert find_overlap.find_consecutive_run(blocks, 3) == (3, 7)
+    assert find_overlap.find_consecutive_run(blocks, 4) == (3, 7)
+    assert find_overlap.find_consecutive_run(blocks, 6) == (9, 11)
+
+
 def test_compute_candidate_ranges():
     md5_hashes = ['#0', '#1', '#2', '#3', '#1', '#2', '#3', '#7']
     offset_blocks = {3: [1, 2, 3]}
@@ -165,10 +290,10 @@ def test_dump_hashes():
     '#%d' substituted hashes
     """
     md5_hashes = ['H0', 'H1', 'H2', 'H3', 'H1', 'H2', 'H3', 'H7']
-    matching_hashes = find_overlap.generate_matching_hashes(md5_hashes)
+    hash_ids = find_overlap.compact_hashes(md5_hashes)
     hashes_fname = 'hashes.txt'
     remove_if_exists(hashes_fname)
-    find_overlap.dump_hashes(hashes_fname, md5_hashes, matching_hashes)
+    find_overlap.dump_hashes(hashes_fname, hash_ids)
     assert os.path.exists(hashes_fname)
     with open(hashes_fname, 'r') as f:
         dumped_hashes = f.read().splitlines()
@@ -179,7 +304,7 @@ def test_dump_hashes():
 def test_dump_hashes_to_non_existent_file():
     """Test trying to write to a non-existent dump hash file exits"""
     with pytest.raises(SystemExit) as e:
-        find_overlap.dump_hashes('/tmp/does/not/exist', [], [])
+        find_overlap.dump_hashes('/tmp/does/not/exist', [])
     assert e.value
 
 
@@ -190,6 +315,21 @@ def test_find_overlap_from_hashes():
                                 total_blocks=8, rank=1.0)]
 
 
+def test_find_overlap_from_hashes_sparse_overlap():
+    """Test an overlap of mostly zero blocks, supported by only two pairs
+    of matching non-zero blocks, is still found
+    """
+    md5_hashes = ['#%d' % blknum for blknum in range(1000)]
+    for blknum in range(400, 650):
+        if blknum not in (450, 470, 550, 570):
+            md5_hashes[blknum] = 'ZERO'
+    md5_hashes[550] = md5_hashes[450]
+    md5_hashes[570] = md5_hashes[470]
+    result = find_overlap.find_overlap_from_hashes(md5_hashes)
+    assert result == [Candidate(offset=100, start_block=400, stop_block=550,
+                                total_blocks=1000, rank=1.5)]
+
+
 def test_print_overlap(capsys):
     """Test printed overlapping block range"""
     cr = Candidate(offset=3, start_block=1, stop_block=4,
@@ -243,6 +383,24 @@ def test_find_overlap_from_open_hashes_file(capsys):
     assert 'Range [1:4) overlaps [4:7)' in out
 
 
+def test_read_dump_hash_ids():
+    f = io.StringIO(u'#0\n#1\n#2\n#1\n')
+    assert list(find_overlap.read_dump_hash_ids(f)) == [0, 1, 2, 1]
+
+
+def test_read_dump_hash_ids_multiple_chunks(monkeypatch):
+    monkeypatch.setattr(find_overlap, 'DUMP_READ_SIZE', 8)
+    f = io.StringIO(u''.join([u'#%d\n' % (i) for i in range(100)]))
+    assert list(find_overlap.read_dump_hash_ids(f)) == list(range(100))
+
+
+def test_read_dump_hash_ids_other_hashes(monkeypatch):
+    """Test lines which aren't '#%d' substitute hashes are compacted"""
+    monkeypatch.setattr(find_overlap, 'DUMP_READ_SIZE', 4)
+    f = io.StringIO(u'#0\n#1\naa\nbb\ncc\nbb\n')
+    assert list(find_overlap.read_dump_hash_ids(f)) == [0, 1, 2, 3, 4, 3]
+
+
 def test_find_overlap_from_open_file(capsys):
     """Test providing single overlapping input reports overlap found"""
     data = b'\x00' * find_overlap.BLOCKSIZE + \
@@ -305,6 +463,28 @@ def test_main_hashes_file_does_not_exist():
     assert result != None
 
 
+def test_default_hash_algorithm():
+    """Test the default hash is the first, fastest, available algorithm
+    and all algorithms produce DIGEST_SIZE byte digests
+    """
+    assert find_overlap.DEFAULT_HASH_ALGORITHM == \
+        find_overlap.HASH_ALGORITHMS[0]
+    assert find_overlap.DEFAULT_HASH_ALGORITHM != 'md5'
+    for algorithm in find_overlap.HASH_ALGORITHMS:
+        digest = find_overlap.compute_hash(algorithm, b'\x01' * 4096)
+        assert len(digest) == find_overlap.DIGEST_SIZE
+
+
+def test_main_hash_option(monkeypatch, capsys):
+    """Test selecting the hash algorithm via main"""
+    monkeypatch.setattr(find_overlap, 'hash_algorithm', 'md5')
+    result = find_overlap.main(['--hash', 'sha256', '/dev/null'])
+    assert result == None
+    assert find_overlap.hash_algorithm == 'sha256'
+    out, err = capsys.readouterr()
+    assert 'No overlapping range found' in out
+
+
 def test_main_dump_hashes():
     """Test dump hashes file is written when requested via main"""
     hashes_fname = 'hashes.txt'